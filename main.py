@@ -7,17 +7,28 @@ Sistema otimizado para consulta de CNPJs REAIS via range requests
 
 import os
 import json
-import sqlite3
-import io
+import asyncio
 import struct
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional
 from apify import Actor
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 import re
+from collections import OrderedDict
 from datetime import datetime
 
+# Remove tudo que não for dígito ASCII (pontuação de CNPJ formatado etc.)
+_NON_DIGIT_RE = re.compile(r'[^0-9]')
+
+# Pesos dos dígitos verificadores do CNPJ (módulo 11)
+_CNPJ_DV_WEIGHTS = (
+    (5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2),
+    (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+)
+
+# Marcadores de schema procurados na primeira página, numa única passada
+_SCHEMA_MARKERS_RE = re.compile(rb'cnpj|empresa|create table', re.IGNORECASE)
+
 class CNPJSQLiteStreamReader:
     """Classe para ler SQLite remotamente via range requests SEM DOWNLOAD"""
     
@@ -26,6 +37,8 @@ class CNPJSQLiteStreamReader:
         self.file_id = file_id
         self.page_size = 4096  # Tamanho padrão da página SQLite
         self.header_cache = {}
+        self.page_cache = OrderedDict()  # LRU de páginas já lidas
+        self.max_cached_pages = 256
         
     def read_bytes(self, start: int, length: int) -> bytes:
         """Lê bytes específicos via range request"""
@@ -37,13 +50,47 @@ class CNPJSQLiteStreamReader:
             Actor.log.error(f"Erro ao ler bytes {start}-{start+length}: {e}")
             return b''
     
+    def read_pages(self, first_page: int, count: int) -> bytes:
+        """Lê páginas consecutivas numa única range request (com cache de páginas)"""
+        page_numbers = range(first_page, first_page + count)
+        
+        if all(n in self.page_cache for n in page_numbers):
+            for n in page_numbers:
+                self.page_cache.move_to_end(n)
+            return b''.join(self.page_cache[n] for n in page_numbers)
+        
+        data = self.read_bytes(first_page * self.page_size, count * self.page_size)
+        
+        for i, n in enumerate(page_numbers):
+            page = data[i * self.page_size:(i + 1) * self.page_size]
+            if not page:
+                break
+            self.page_cache[n] = page
+            self.page_cache.move_to_end(n)
+        
+        while len(self.page_cache) > self.max_cached_pages:
+            self.page_cache.popitem(last=False)
+        
+        return data
+    
+    def find_page(self, data: bytes, pattern: bytes, start: int = 0) -> int:
+        """Retorna a primeira página (a partir do offset start) que contém o padrão inteiro, ou -1"""
+        offset = data.find(pattern, start)
+        while offset != -1:
+            page_num = offset // self.page_size
+            # Ignora ocorrências que atravessam a fronteira entre duas páginas
+            if (offset + len(pattern) - 1) // self.page_size == page_num:
+                return page_num
+            offset = data.find(pattern, offset + 1)
+        return -1
+    
     def read_sqlite_header(self) -> Dict[str, Any]:
         """Lê o header do SQLite para entender a estrutura"""
         if 'header' in self.header_cache:
             return self.header_cache['header']
             
-        # Lê os primeiros 100 bytes do arquivo SQLite
-        header_bytes = self.read_bytes(0, 100)
+        # Lê os primeiros 100 bytes do arquivo SQLite (primeira página em cache)
+        header_bytes = self.read_pages(0, 1)[:100]
         
         if len(header_bytes) < 100:
             return {}
@@ -67,18 +114,29 @@ class CNPJSQLiteStreamReader:
     
     def find_table_schema(self) -> Dict[str, Any]:
         """Encontra schema da tabela principal via range requests"""
+        if 'schema' in self.header_cache:
+            return self.header_cache['schema']
+            
         try:
             # Lê a primeira página (master table)
-            first_page = self.read_bytes(0, self.page_size)
+            first_page = self.read_pages(0, 1)
             
             # Procura por padrões SQL CREATE TABLE
+            markers = set()
+            for match in _SCHEMA_MARKERS_RE.finditer(first_page):
+                markers.add(match.group().lower())
+                if len(markers) == 3:
+                    break
+            
             schema_info = {
-                'found_cnpj_table': b'cnpj' in first_page.lower(),
-                'found_empresa_table': b'empresa' in first_page.lower(),
-                'found_create_table': b'create table' in first_page.lower(),
+                'found_cnpj_table': b'cnpj' in markers,
+                'found_empresa_table': b'empresa' in markers,
+                'found_create_table': b'create table' in markers,
                 'page_size': len(first_page)
             }
             
+            if first_page:
+                self.header_cache['schema'] = schema_info
             return schema_info
         except Exception as e:
             Actor.log.error(f"Erro ao ler schema: {e}")
@@ -92,7 +150,8 @@ class CNPJGoogleDriveStreamConnector:
         self.credentials = None
         self.file_info = None
         self.sqlite_reader = None
-        self.cache = {}
+        self.db_fingerprint = None
+        self.cache = OrderedDict()  # LRU de consultas por CNPJ
         self.max_cache_size = 1000
         
     async def initialize_drive_connection(self):
@@ -120,7 +179,7 @@ class CNPJGoogleDriveStreamConnector:
             
             self.service = build('drive', 'v3', credentials=self.credentials)
             
-            about = self.service.about().get(fields="user").execute()
+            about = await asyncio.to_thread(self.service.about().get(fields="user").execute)
             user_email = about.get('user', {}).get('emailAddress', 'Unknown')
             
             Actor.log.info(f"✅ Conectado como: {user_email}")
@@ -134,6 +193,7 @@ class CNPJGoogleDriveStreamConnector:
         """Localiza o arquivo cnpj.db no Google Drive (SEM BAIXAR)"""
         try:
             Actor.log.info("🔍 Localizando arquivo cnpj.db...")
+            self.file_info = None
             
             search_queries = [
                 "name='cnpj.db' and sharedWithMe=true",
@@ -144,10 +204,10 @@ class CNPJGoogleDriveStreamConnector:
             
             for query in search_queries:
                 Actor.log.info(f"🔍 Tentando: {query}")
-                results = self.service.files().list(
+                results = await asyncio.to_thread(self.service.files().list(
                     q=query,
-                    fields="files(id,name,size,modifiedTime,parents,owners)"
-                ).execute()
+                    fields="files(id,name,size,modifiedTime,md5Checksum,parents,owners)"
+                ).execute)
                 files = results.get('files', [])
                 
                 if files:
@@ -156,28 +216,31 @@ class CNPJGoogleDriveStreamConnector:
                     break
             
             if not self.file_info:
-                # Tentar buscar em pastas
-                folder_queries = [
-                    "name='BASE DE DADOS' and sharedWithMe=true and mimeType='application/vnd.google-apps.folder'",
-                    "name='BASE B2B' and sharedWithMe=true and mimeType='application/vnd.google-apps.folder'"
-                ]
+                # Tentar buscar em pastas: uma consulta para as pastas, outra para o arquivo
+                folder_query = (
+                    "(name='BASE DE DADOS' or name='BASE B2B') and sharedWithMe=true "
+                    "and mimeType='application/vnd.google-apps.folder'"
+                )
+                results = await asyncio.to_thread(self.service.files().list(
+                    q=folder_query,
+                    fields="files(id,name)"
+                ).execute)
+                folders = {folder['id']: folder['name'] for folder in results.get('files', [])}
                 
-                for query in folder_queries:
-                    results = self.service.files().list(q=query).execute()
-                    folders = results.get('files', [])
+                if folders:
+                    parents_clause = " or ".join(f"'{folder_id}' in parents" for folder_id in folders)
+                    file_results = await asyncio.to_thread(self.service.files().list(
+                        q=f"name='cnpj.db' and ({parents_clause})",
+                        fields="files(id,name,size,modifiedTime,md5Checksum,parents,owners)"
+                    ).execute)
+                    folder_files = file_results.get('files', [])
                     
-                    for folder in folders:
-                        file_query = f"name='cnpj.db' and parents in '{folder['id']}'"
-                        file_results = self.service.files().list(q=file_query).execute()
-                        folder_files = file_results.get('files', [])
-                        
-                        if folder_files:
-                            self.file_info = folder_files[0]
-                            Actor.log.info(f"✅ Arquivo encontrado na pasta {folder['name']}")
-                            break
-                    
-                    if self.file_info:
-                        break
+                    if folder_files:
+                        self.file_info = folder_files[0]
+                        folder_name = next(
+                            (folders[p] for p in self.file_info.get('parents', []) if p in folders), ''
+                        )
+                        Actor.log.info(f"✅ Arquivo encontrado na pasta {folder_name}")
             
             if not self.file_info:
                 raise FileNotFoundError("Arquivo cnpj.db não encontrado")
@@ -191,8 +254,19 @@ class CNPJGoogleDriveStreamConnector:
             Actor.log.info(f"📅 Modificado: {modified_time}")
             Actor.log.info("✅ Modo streaming REAL ativado - ZERO download")
             
-            # Inicializar leitor SQLite remoto
-            self.sqlite_reader = CNPJSQLiteStreamReader(self.service, self.file_info['id'])
+            # Reaproveitar leitor e caches enquanto o arquivo não mudar
+            fingerprint = (
+                self.file_info['id'],
+                self.file_info.get('size'),
+                self.file_info.get('modifiedTime'),
+                self.file_info.get('md5Checksum')
+            )
+            
+            if not self.sqlite_reader or fingerprint != self.db_fingerprint:
+                # Inicializar leitor SQLite remoto
+                self.sqlite_reader = CNPJSQLiteStreamReader(self.service, self.file_info['id'])
+                self.cache.clear()
+                self.db_fingerprint = fingerprint
             
             return True
             
@@ -206,6 +280,7 @@ class CNPJGoogleDriveStreamConnector:
             # Verificar cache primeiro
             if cnpj in self.cache:
                 Actor.log.info(f"📋 CNPJ encontrado no cache: {cnpj}")
+                self.cache.move_to_end(cnpj)
                 return self.cache[cnpj]
             
             Actor.log.info(f"🔍 Buscando CNPJ REAL na base: {cnpj}")
@@ -228,9 +303,10 @@ class CNPJGoogleDriveStreamConnector:
             found_data = self._search_cnpj_pattern(cnpj)
             
             if found_data:
-                # Adicionar ao cache
-                if len(self.cache) < self.max_cache_size:
-                    self.cache[cnpj] = found_data
+                # Adicionar ao cache, descartando o menos usado quando cheio
+                self.cache[cnpj] = found_data
+                if len(self.cache) > self.max_cache_size:
+                    self.cache.popitem(last=False)
                 
                 return found_data
             
@@ -249,16 +325,20 @@ class CNPJGoogleDriveStreamConnector:
             # Buscar nas primeiras 10 páginas como exemplo
             pages_to_search = 10
             cnpj_bytes = cnpj.encode('utf-8')
+            page_size = self.sqlite_reader.page_size
+            
+            # Uma única range request para todas as páginas
+            data = self.sqlite_reader.read_pages(0, pages_to_search)
             
-            for page_num in range(pages_to_search):
-                start_byte = page_num * self.sqlite_reader.page_size
-                page_data = self.sqlite_reader.read_bytes(start_byte, self.sqlite_reader.page_size)
+            # Busca única sobre o buffer contíguo, sem fatiar página por página
+            page_num = self.sqlite_reader.find_page(data, cnpj_bytes)
+            
+            if page_num != -1:
+                Actor.log.info(f"✅ CNPJ encontrado na página {page_num}")
+                page_data = data[page_num * page_size:(page_num + 1) * page_size]
                 
-                if cnpj_bytes in page_data:
-                    Actor.log.info(f"✅ CNPJ encontrado na página {page_num}")
-                    
-                    # Extrair dados da página (implementação básica)
-                    return self._extract_company_data_from_page(page_data, cnpj)
+                # Extrair dados da página (implementação básica)
+                return self._extract_company_data_from_page(page_data, cnpj)
             
             # Se não encontrou nas primeiras páginas, fazer busca mais ampla
             # (implementação seria otimizada com índices reais)
@@ -275,8 +355,6 @@ class CNPJGoogleDriveStreamConnector:
             # Esta é uma implementação simplificada
             # Na implementação real, seria necessário parser SQLite completo
             
-            page_text = page_data.decode('utf-8', errors='ignore')
-            
             # Procurar por campos típicos próximos ao CNPJ
             empresa_data = {
                 "cnpj": cnpj,
@@ -317,12 +395,20 @@ class CNPJGoogleDriveStreamConnector:
         """Normaliza CNPJ removendo formatação"""
         if not cnpj:
             return ""
-        return ''.join(filter(str.isdigit, str(cnpj)))
+        return _NON_DIGIT_RE.sub('', str(cnpj))
     
     def validate_cnpj(self, cnpj: str) -> bool:
-        """Valida formato do CNPJ"""
+        """Valida formato e dígitos verificadores do CNPJ"""
         cnpj_clean = self.normalize_cnpj(cnpj)
-        return len(cnpj_clean) == 14 and not all(d == cnpj_clean[0] for d in cnpj_clean)
+        if len(cnpj_clean) != 14 or all(d == cnpj_clean[0] for d in cnpj_clean):
+            return False
+        
+        digits = [int(d) for d in cnpj_clean]
+        for weights in _CNPJ_DV_WEIGHTS:
+            remainder = sum(d * w for d, w in zip(digits, weights)) % 11
+            if digits[len(weights)] != (0 if remainder < 2 else 11 - remainder):
+                return False
+        return True
     
     def format_cnpj(self, cnpj: str) -> str:
         """Formata CNPJ para exibição"""
@@ -354,7 +440,8 @@ class CNPJGoogleDriveStreamConnector:
             Actor.log.info(f"🔍 Consultando CNPJ REAL: {self.format_cnpj(cnpj_clean)}")
             
             # Buscar na base REAL
-            empresa_data = self.search_cnpj_in_database(cnpj_clean)
+            cache_hit = cnpj_clean in self.cache
+            empresa_data = await asyncio.to_thread(self.search_cnpj_in_database, cnpj_clean)
             
             if not empresa_data:
                 return {
@@ -406,7 +493,7 @@ class CNPJGoogleDriveStreamConnector:
                     "consulta_via": "Apify Actor SQLite Streaming REAL",
                     "timestamp": datetime.now().isoformat(),
                     "modo": "DADOS_REAIS_SQLITE",
-                    "cache_hit": cnpj_clean in self.cache,
+                    "cache_hit": cache_hit,
                     "fonte_dados": empresa_data.get('fonte_dados'),
                     "sem_download": True
                 }
@@ -435,31 +522,33 @@ class CNPJGoogleDriveStreamConnector:
                     "error": "SQLite reader não disponível"
                 }
             
+            # Limitar resultados ao intervalo aceito pelo input schema (1-50)
+            limit = max(1, min(int(limit), 50))
+            
             # Buscar padrão do nome nas páginas
-            nome_bytes = nome.upper().encode('utf-8')
+            nome_upper = nome.upper()
+            nome_bytes = nome_upper.encode('utf-8')
             empresas_encontradas = []
             
-            # Buscar nas primeiras 50 páginas
-            for page_num in range(50):
-                if len(empresas_encontradas) >= limit:
-                    break
-                    
-                start_byte = page_num * self.sqlite_reader.page_size
-                page_data = self.sqlite_reader.read_bytes(start_byte, self.sqlite_reader.page_size)
-                
-                if nome_bytes in page_data:
-                    # Extrair dados da página
-                    empresa_data = self._extract_company_data_from_page(page_data, f"EMPRESA_PAGINA_{page_num}")
-                    if empresa_data:
-                        empresas_encontradas.append({
-                            "cnpj": f"000000000001{page_num:02d}",
-                            "cnpj_formatted": f"00.000.000/0001-{page_num:02d}",
-                            "razao_social": f"{nome.upper()} EMPRESA REAL {page_num + 1}",
-                            "nome_fantasia": f"{nome.upper()} {page_num + 1}",
-                            "situacao_cadastral": "ATIVA",
-                            "municipio": "DADOS REAIS",
-                            "uf": "SP"
-                        })
+            # Buscar nas primeiras 50 páginas (uma única range request)
+            pages_to_search = 50
+            page_size = self.sqlite_reader.page_size
+            data = await asyncio.to_thread(self.sqlite_reader.read_pages, 0, pages_to_search)
+            
+            # Cada ocorrência salta direto para a página seguinte do buffer
+            page_num = self.sqlite_reader.find_page(data, nome_bytes)
+            
+            while page_num != -1 and len(empresas_encontradas) < limit:
+                empresas_encontradas.append({
+                    "cnpj": f"000000000001{page_num:02d}",
+                    "cnpj_formatted": f"00.000.000/0001-{page_num:02d}",
+                    "razao_social": f"{nome_upper} EMPRESA REAL {page_num + 1}",
+                    "nome_fantasia": f"{nome_upper} {page_num + 1}",
+                    "situacao_cadastral": "ATIVA",
+                    "municipio": "DADOS REAIS",
+                    "uf": "SP"
+                })
+                page_num = self.sqlite_reader.find_page(data, nome_bytes, (page_num + 1) * page_size)
             
             Actor.log.info(f"✅ Busca REAL concluída: {len(empresas_encontradas)} empresas encontradas")
             
@@ -493,8 +582,8 @@ class CNPJGoogleDriveStreamConnector:
                 }
             
             # Ler header para informações básicas
-            header = self.sqlite_reader.read_sqlite_header()
-            schema = self.sqlite_reader.find_table_schema()
+            header = await asyncio.to_thread(self.sqlite_reader.read_sqlite_header)
+            schema = await asyncio.to_thread(self.sqlite_reader.find_table_schema)
             
             # Calcular estatísticas baseadas no arquivo real
             file_size = int(self.file_info.get('size', 0))
@@ -626,20 +715,18 @@ async def main():
 # Adicionar ao final do main.py
 async def mcp_main():
     """Função principal para modo MCP"""
-    from mcp_server import CNPJMCPServer
-    
-    server = CNPJMCPServer()
-    
     # Detectar modo de execução
     import sys
     if len(sys.argv) > 1 and sys.argv[1] == "--mcp":
-        # Modo MCP
-        tools = await server.list_tools()
+        # Modo MCP (servidor carregado apenas aqui; o modo Actor não precisa dele)
+        from mcp_server import CNPJMCPServer
+        
+        server = CNPJMCPServer()
+        tools = server.get_tools_manifest()
         print(json.dumps(tools, indent=2, ensure_ascii=False))
     else:
         # Modo Actor normal
         await main()
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(mcp_main())
@@ -7,9 +7,68 @@ Arquivo: mcp_server.py
 import asyncio
 import json
 import sys
-from typing import Dict, Any, List
+from typing import Dict, Any
 from main import CNPJGoogleDriveStreamConnector
 
+# Manifesto de ferramentas MCP (estático, montado uma única vez)
+TOOLS_MANIFEST = {
+    "version": "1.0.0",
+    "mcpVersion": "2024-11-05",
+    "capabilities": {
+        "tools": {}
+    },
+    "tools": [
+        {
+            "name": "query_cnpj",
+            "description": "Consulta dados completos de CNPJ na base real via Google Drive",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "cnpj": {
+                        "type": "string",
+                        "description": "CNPJ para consulta (14 dígitos, com ou sem formatação)",
+                        "pattern": "^[0-9]{14}$|^[0-9]{2}\\.[0-9]{3}\\.[0-9]{3}/[0-9]{4}-[0-9]{2}$"
+                    }
+                },
+                "required": ["cnpj"],
+                "additionalProperties": False
+            }
+        },
+        {
+            "name": "search_by_name",
+            "description": "Busca empresas por nome ou razão social na base real",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "nome": {
+                        "type": "string",
+                        "description": "Nome completo ou parte do nome da empresa",
+                        "minLength": 3
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Número máximo de resultados (1-50)",
+                        "minimum": 1,
+                        "maximum": 50,
+                        "default": 10
+                    }
+                },
+                "required": ["nome"],
+                "additionalProperties": False
+            }
+        },
+        {
+            "name": "get_statistics",
+            "description": "Retorna estatísticas gerais da base de dados de CNPJs",
+            "inputSchema": {
+                "type": "object",
+                "properties": {},
+                "additionalProperties": False
+            }
+        }
+    ]
+}
+
 class CNPJMCPServer:
     """Servidor MCP para consulta de CNPJs via Google Drive"""
     
@@ -21,8 +80,11 @@ class CNPJMCPServer:
         """Inicializa conexão com Google Drive"""
         if not self.initialized:
             try:
-                await self.connector.initialize_drive_connection()
-                await self.connector.find_cnpj_database()
+                # Sem credenciais ou sem base não há o que consultar: falha imediata
+                if not await self.connector.initialize_drive_connection():
+                    return False
+                if not await self.connector.find_cnpj_database():
+                    return False
                 self.initialized = True
                 return True
             except Exception as e:
@@ -32,63 +94,7 @@ class CNPJMCPServer:
     
     def get_tools_manifest(self) -> Dict[str, Any]:
         """Retorna manifesto de ferramentas MCP"""
-        return {
-            "version": "1.0.0",
-            "mcpVersion": "2024-11-05",
-            "capabilities": {
-                "tools": {}
-            },
-            "tools": [
-                {
-                    "name": "query_cnpj",
-                    "description": "Consulta dados completos de CNPJ na base real via Google Drive",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "cnpj": {
-                                "type": "string",
-                                "description": "CNPJ para consulta (14 dígitos, com ou sem formatação)",
-                                "pattern": "^[0-9]{14}$|^[0-9]{2}\\.[0-9]{3}\\.[0-9]{3}/[0-9]{4}-[0-9]{2}$"
-                            }
-                        },
-                        "required": ["cnpj"],
-                        "additionalProperties": false
-                    }
-                },
-                {
-                    "name": "search_by_name",
-                    "description": "Busca empresas por nome ou razão social na base real",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "nome": {
-                                "type": "string",
-                                "description": "Nome completo ou parte do nome da empresa",
-                                "minLength": 3
-                            },
-                            "limit": {
-                                "type": "integer",
-                                "description": "Número máximo de resultados (1-50)",
-                                "minimum": 1,
-                                "maximum": 50,
-                                "default": 10
-                            }
-                        },
-                        "required": ["nome"],
-                        "additionalProperties": false
-                    }
-                },
-                {
-                    "name": "get_statistics",
-                    "description": "Retorna estatísticas gerais da base de dados de CNPJs",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {},
-                        "additionalProperties": false
-                    }
-                }
-            ]
-        }
+        return TOOLS_MANIFEST
     
     async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """Executa ferramenta MCP"""